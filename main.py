@@ -1,4 +1,3 @@
-import glob
 import logging
 import os
 from multiprocessing import Pool
@@ -12,7 +11,7 @@ from papyrser_core.parser import TEIParser
 from papyrser_io.downloader import PapyriDownloader
 from papyrser_io.handler import IOHandler
 from papyrser_io.pap_filter import PapyrusFilter
-from papyrser_utils.utils import get_tm_from_paths, setup_logging, before_running
+from papyrser_utils.utils import get_tms_from_collections, setup_logging, before_running
 
 logger = logging.getLogger(f"{__name__}")
 
@@ -41,21 +40,19 @@ def run(target: int | list[int] | str | list[str] | PapyrusFilter):
     elif isinstance(target, list):
         types = list(set(type(x) for x in target))
         if len(types) == 1 and types[0] == int:
-            target.sort()
             if not io_handler.export_directory:
-                io_handler.set_export_directory(f'{target[0]}-{target[-1]}')
+                io_handler.set_export_directory(f'{min(target)}-{max(target)}')
         elif len(types) == 1 and types[0] == str:
             collections = os.listdir(os.path.join(idp_data_path, 'DDB_EpiDoc_XML'))
-            files = []
+            found = []
             for collection in target:
                 collection = cast(str, collection)
                 if collection.lower() in collections:
-                    files += glob.glob(os.path.join(idp_data_path, f'DDB_EpiDoc_XML/{collection.lower()}/**/*.xml'))
+                    found.append(collection)
                 else:
                     logger.critical(f'Collection {collection}] not found. Please enter a valid collection name in '
                                     f'config.papyrus_target.')
-            data = get_tm_from_paths(files)
-            target = [d.get('tm') for d in data]
+            target = get_tms_from_collections(found)
         else:
             msg = f'Invalid papyrus_target set in config: A list must either contain only str or int values.'
             logger.critical(msg)
@@ -65,9 +62,7 @@ def run(target: int | list[int] | str | list[str] | PapyrusFilter):
         io_handler.set_export_directory(target)
         collections = os.listdir(os.path.join(idp_data_path, 'DDB_EpiDoc_XML'))
         if target.lower() in collections:
-            files = glob.glob(os.path.join(idp_data_path, f'DDB_EpiDoc_XML/{target.lower()}/**/*.xml'))
-            data = get_tm_from_paths(files)
-            target = [d.get('tm') for d in data]
+            target = get_tms_from_collections([target])
         else:
             msg = 'Collection not found. Please enter a valid collection name in config.papyrus_target.'
             print(msg)
@@ -78,15 +73,13 @@ def run(target: int | list[int] | str | list[str] | PapyrusFilter):
         logger.critical(msg)
         print(msg)
         exit(1)
-    if len(target) > 1:
-        target = list(set(target))
-    if len(target) > os.cpu_count() and not debug_mode:
-        pool = Pool(os.cpu_count() + 1)
-        bar = tqdm(total=len(target), desc='Parsing')
-        for skipped in pool.imap_unordered(parser.process_tei, target):
-            if skipped:
-                logger.warning(skipped)
-            bar.update()
+    # Drop TM numbers found more than once, e.g. via several collections or files sharing a TM number
+    target = sorted(set(target))
+    if len(target) >= os.cpu_count() and not debug_mode:
+        with Pool(os.cpu_count()) as pool:
+            for skipped in tqdm(pool.imap_unordered(parser.process_tei, target), total=len(target), desc='Parsing'):
+                if skipped:
+                    logger.warning(skipped)
     else:
         for t in tqdm(target, total=len(target), desc='Parsing'):
             skipped = parser.process_tei(t)
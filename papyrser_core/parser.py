@@ -1,15 +1,291 @@
 import logging
 import os
 import re
+from itertools import chain
+from typing import Iterator
 
-from bs4 import BeautifulSoup, Tag
-from bs4.element import NavigableString, PageElement, ResultSet
 from lxml import etree
 
 from config import debug_mode, ignore_formatting_issues, write_to_json, write_to_txt
 from papyrser_core.format import Formatter
 from papyrser_io.handler import IOHandler
-from papyrser_utils.utils import get_paths_to_tm, convert_to_standardized_majuscule, ns
+from papyrser_utils.utils import (get_paths_to_tm, convert_to_standardized_majuscule, ns, xml_parser,
+                                  not_yet_implemented_path)
+
+_XPATH_DCLP_HYBRID = etree.XPath('//tei:publicationStmt/tei:idno[@type="dclp-hybrid"]/text()', namespaces=ns)
+_XPATH_TITLE = etree.XPath('//tei:titleStmt/tei:title/text()', namespaces=ns)
+_XPATH_FILENAME = etree.XPath('//tei:publicationStmt/tei:idno[@type="filename"]/text()', namespaces=ns)
+_XML_ID = '{http://www.w3.org/XML/1998/namespace}id'
+_TEI_HEADER = f'{{{ns["tei"]}}}teiHeader'
+# Tags which TEIParser.parse_contents() hands to transform() as a whole instead of recursing into their children
+_TRANSFORM_WHOLE_TAGS = frozenset({'expan', 'supplied', 'subst', 'add', 'gap', 'hi'})
+_RE_TITLE_CHARS = re.compile(r'[a-zA-Z0-9,.-]')
+# Insertion markers left by TEIParser.add(): <text< belongs before the line, >text> after it
+_RE_LEFT_INSERTION = re.compile(r'<(.*?)<')
+_RE_RIGHT_INSERTION = re.compile(r'>(.*?)>')
+
+# Unicode representations used by TEIParser.milestone(), TEIParser.ex() and TEIParser.gtype()
+_MILESTONE_MAP = {
+    "paragraphos": '\n\u2e0f',
+    "horizontal-rule": '\n\u2015',
+    "diple-obelismene": '\n\u2E10',
+    "wavy-line": '\n\u223C',
+    "coronis": '\n\u2E0E'
+}
+
+_EX_MAP = {
+    # year
+    "ΕΤΟΥΣ": "\U00010179",
+    "ΕΤΟΣ": "\U00010179",
+    "ΕΤΩΝ": "\U00010179",
+    "ΕΤΕΣΙ": "\U00010179",
+    # measures
+    "ΑΡΟΥΡ": "\U00010187",
+    "ΑΡΤΑΒ": "\U00010186",
+    "ΧΟΙΝΙ": "\uE674",
+    "ΞΕΣΤΗ": "\U00010185",
+    "ΞΕΣΤΟ": "\U00010185",
+    "ΞΕΣΤΩ": "\U00010185",
+    "ΛΙΤΡΑ": "\U00010183",
+    "ΛΙΤΡΩ": "\U00010183",
+    "ΟΥΓΚΙ": "\U00010184",
+    "ΜΕΤΡΕ": "\uE63D",
+    "ΜΕΤΡΟ": "\uE63D",
+    # numbers and fractions
+    "ΤΡΙΤΟ": "\u2C85",
+    "ΤΕΤΑΡ": "\uE606",
+    # money
+    "ΔΡΑΧΜ": "\U0001017B",
+    "ΟΒΟΛΟ": "\U0001017C",
+    "ΔΙΩΒΟ": "\U0001017D",
+    "ΤΡΙΩΒ": "\U0001017E",
+    "ΤΕΤΡΩ": "\U0001017F",
+    "ΠΕΝΤΩ": "\U00010180",
+    "ΗΜΙΩΒ": "\uE675",
+    "ΗΜΙΟΒ": "\uE675",
+    "ΧΑΛΚΟ": "\u2CAC",
+    "ΔΙΧΑΛ": "\u2CAD",
+    "ΚΕΡΑΤ": "\uE67D",
+    "ΤΑΛΑΝ": "\U0001017A",
+    "ΔΗΝΑΡ": "\uE6A3",
+    "ΝΟΜΙΣ": "\uE696",
+    "ΜΥΡΙΑ": "\uE616",
+    # wheat
+    "ΠΥΡΟΥ": "\uE63E",
+    "ΠΥΡΩ": "\uE63E",
+    "ΠΥΡΩΙ": "\uE63E",
+    "ΠΥΡΟΝ": "\uE63E",
+    "ΠΥΡΟΣ": "\uE63E",
+    # operators
+    "ΓΙΝΟΝ": "\uE691",
+    "ΓΙΝΕΤ": "\uE691",
+    "ΓΙΓΝΟ": "\uE691",
+    "ΓΙΓΝΕ": "\uE691",
+    "ΛΟΙΠΩ": "\uE613",
+    "ΛΟΙΠΟ": "\uE613",
+    # fractions
+    "ΗΜΙΣΥ": "\U00010175",
+    # monograms
+    "ΠΡΟΣ": "\U0000E688",
+    "ΓΡΑΜΜ": "\U0000E689",
+    "ΖΜΥΡΝ": "\U0000E68A",
+    "ΩΡΑ": "\U0000E68B",
+    "ΩΡΑΣ": "\U0000E68B",
+    "ΜΕΡΙΣ": "\U0000E68C",
+    "ΜΕΡΙΔ": "\U0000E68C",
+    "ΧΕΙΡΙ": "\U0000E68E",
+    "ΧΡΩ": "\U00002CE9",
+    # other symbols
+    "ΑΥΤΟΣ": "\U0000E632",
+    "ΑΥΤΟΥ": "\U0000E632",
+    "ΑΥΤΩ": "\U0000E632",
+    "ΑΥΤΩΙ": "\U0000E632",
+    "ΑΥΤΟΝ": "\U0000E632",
+    "ΑΥΤΟΙ": "\U0000E632",
+    "ΑΥΤΩΝ": "\U0000E632",
+    "ΑΥΤΗ": "\U0000E632",
+    "ΑΥΤΗΣ": "\U0000E632",
+    "ΑΥΤΗΙ": "\U0000E632",
+    "ΑΥΤΗΝ": "\U0000E632",
+    "ΑΥΤΑΙ": "\U0000E632",
+    "ΑΥΤΑΣ": "\U0000E632",
+    "ΧΑΙΡΕ": "\U0000E687",
+    "ΥΠΕΡ": "\U0000E67A",
+    "ΟΜΟΥ": "\U0000E670",
+    "ΙΝΔΙΚ": "\U0000E698",
+    # additional symbols
+    "ΔΙΜΟΙ": "\U0000E698",
+}
+
+_GTYPE_MAP = {
+    "anti-sigma": "\u037B",
+    "antisigma": "\u037B",
+    "antisigma-periestigmene": "\u037D",
+    "apostrophe": "\u0027",
+    "asteriskos": "\u002A",
+    "backslash": "\uFE68",
+    "backtick": "\u2E0C",
+    "brevis": "\u02D8",
+    "center-brace-closing": "\u23AC",
+    "check": "\u2044",
+    "chi-periestigmenon": "\u00B7\u03A7\u00B7",
+    "chirho": "\u2627",
+    "coronis": "\u2E0E",
+    "coronis-lower-half": "\U000F0224",
+    "cross": "\u271D",
+    "dagger": "\u2020",
+    "dash": "\u2012",
+    "dicolon": "\u003A",
+    "di-punctus": "\u205A",
+    "diastole": "\u02BC",
+    "diple": "\uFE65",
+    "diple-obelismene": "\u291A",
+    "diple-periestigmene": "\u2E16",
+    "dipunct": "\u205A",
+    "dot": "\u2E31",
+    "dotted-obelos": "\u2E13",
+    "double-horizontal-bar": "\u0305" + "\u0332",
+    "double-slanting-stroke": "\u002F" + "\u002F",
+    "double-vertical-bar": "\u2016",
+    "downwards-ancora": "\u2E15",
+    "filled-circle": "\u29BF",
+    "filler": "\u07DF",
+    "hedera": "\u2766",
+    "high-puctus": "\u0387",
+    "high-punctus": "\u0387",
+    "high-puncuts": "\u0387",
+    "hight-punctus": "\u0387",
+    "hyphen": "\u2010",
+    "hypodiastole": "\u2E12",
+    "long-vertical-bar": "\u007C",
+    "low-punctus": "\uFE52",
+    "lower-brace-closing": "\u23AD",
+    "lower-brace-opening": "\u23A9",
+    "middot": "\u00B7",
+    "middod": "\u00B7",
+    "obelos": "\u2015",
+    "obelos-periestigmenos": "\u2E13",
+    "parens-deletion-closing": "\u23AC",
+    "parens-deletion-opening": "\u23A8",
+    "parens-lower-closing": "\u23A0",
+    "parens-lower-opening": "\u239D",
+    "parens-middle-closing": "\u239F",
+    "parens-middle-opening": "\u239C",
+    "parens-upper-closing": "\u239E",
+    "parens-upper-opening": "\u239B",
+    "parens-punctuation-closing": "\u23AC",
+    "parens-punctuation-opening": "\u23A8",
+    "parent-punctuation-opening": "\u23A8",
+    "percent": "\u0025",
+    "reverse-dotted-obelos": "\u00B7\u005C\u00B7",
+    "rho-cross": "\u2CE8",
+    "s-etous": "\U00010179",
+    "short-vertical-bar": "\uE197",
+    "sinusoid-stroke": "\uE0E7",
+    "slanting-stroke": "\u002F",
+    "slashed-N": "\u203E",
+    "stauros": "\u2020",
+    "swungdash": "\u007E",
+    "tetrapunct": "\u2058",
+    "tilde": "\u007E",
+    "tripunct": "\u22EE",
+    "upper-brace-closing": "\u23AB",
+    "upper-brace-opening": "\u23A7",
+    "upward-pointing-arrowhead": "\u2197",
+    "upwards-ancora": "\u2E15",
+    "x": "\u004E",
+    "xs": "\u004E\u004E\u004E"
+}
+
+# Combining characters appended by TEIParser.hi() to the text of <hi>, by rend attribute
+_HI_COMBINING_MAP = {
+    "diaeresis": '\u0308',
+    "asper": '\u0314',
+    "acute": '\u0301',
+    "circumflex": '\u0342',
+    "grave": '\u0300',
+    "lenis": '\u0313',
+    "overdot": '\u0307'
+}
+# Combining characters appended by TEIParser.hi() to each letter of the text of <hi>, by rend attribute
+_HI_EACH_LETTER_MAP = {
+    "underlined": '\u0332',
+    "underline": '\u0332',
+    "supraline": '\u0305',
+    "supraline-underline": '\u0305\u0332'
+}
+
+# Lenient towards malformed XML like the BeautifulSoup lxml-xml builder used before
+_TEI_PARSER = etree.XMLParser(recover=True, collect_ids=False)
+
+
+def _name(element: etree._Element) -> str:
+    """
+    Gets the name of an element without namespace.
+    :param element: lxml element
+    :return: Local name of the element
+    """
+    return etree.QName(element).localname
+
+
+def _text(element: etree._Element) -> str:
+    """
+    Gets the complete text an element contains, including the text of its descendants.
+    :param element: lxml element
+    :return: Text of the element
+    """
+    return ''.join(element.itertext())
+
+
+def _contents(element: etree._Element) -> Iterator[str | etree._Element]:
+    """
+    Yields the child elements and text nodes of an element in document order. Comments and processing instructions
+    are skipped, the text following them is kept.
+    :param element: lxml element
+    :return: Generator of child elements and text nodes (str)
+    """
+    if element.text is not None:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str):
+            yield child
+        if child.tail is not None:
+            yield child.tail
+
+
+def _following(element: etree._Element) -> Iterator[str | etree._Element]:
+    """
+    Yields the elements and text nodes following an element on the same level, starting with its tail.
+    :param element: lxml element
+    :return: Generator of following sibling elements and text nodes (str)
+    """
+    if element.tail is not None:
+        yield element.tail
+    for sibling in element.itersiblings():
+        if isinstance(sibling.tag, str):
+            yield sibling
+        if sibling.tail is not None:
+            yield sibling.tail
+
+
+def _to_string(node: str | etree._Element) -> str:
+    """
+    Serializes an element without its tail for debug messages; text nodes are returned as they are.
+    :param node: lxml element or text node
+    :return: String representation of the node
+    """
+    if isinstance(node, str):
+        return node
+    return etree.tostring(node, encoding='unicode', with_tail=False)
+
+
+def _midpoint(attrs: dict) -> int:
+    """
+    Gets the extent of <gap> or <space> given as range by the attributes atLeast and atMost.
+    :param attrs: Attributes of the tag
+    :return: Rounded mean of atLeast and atMost
+    """
+    return round((int(attrs['atLeast']) + int(attrs['atMost'])) / 2)
 
 
 class TEIParser:
@@ -29,16 +305,19 @@ class TEIParser:
         if 'DDB_EpiDoc_XML' in file:
             return file.split(os.sep)[-1].replace('.xml', '')
         else:
-            root = etree.parse(file)
-            dclp_hybrid = root.xpath('//tei:publicationStmt/tei:idno[@type="dclp-hybrid"]/text()', namespaces=ns)
+            # All values are part of <teiHeader>, so parsing stops there and the text body is never parsed
+            with open(file, 'rb') as f:
+                _, header = next(etree.iterparse(f, events=('end',), tag=_TEI_HEADER, collect_ids=False), (None, None))
+            root = header.getroottree() if header is not None else etree.parse(file, xml_parser)
+            dclp_hybrid = _XPATH_DCLP_HYBRID(root)
             if dclp_hybrid:
                 dclp_hybrid = str(dclp_hybrid[0]).replace(';;', '.').replace(',', '+')
-            title = root.xpath('//tei:titleStmt/tei:title/text()', namespaces=ns)
+            title = _XPATH_TITLE(root)
             if title:
                 title = str(title[0]).replace(' ', '')
-                title = ''.join(re.findall(r'[a-zA-Z0-9,.-]', title))
+                title = ''.join(_RE_TITLE_CHARS.findall(title))
                 title = title.replace(',', '+')
-            filename = root.xpath('//tei:publicationStmt/tei:idno[@type="filename"]/text()', namespaces=ns)[0]
+            filename = _XPATH_FILENAME(root)[0]
             if dclp_hybrid:
                 return dclp_hybrid
             elif title:
@@ -57,13 +336,12 @@ class TEIParser:
             if debug_mode:
                 self.logger.error(msg)
             return msg
-        for i in range(len(files)):
-            file = files[i]
+        for file in files:
             filename = self.__set_filename(file)
             if debug_mode:
                 self.logger.info(f'\n\n### Processing {file} (TM {tm}) ###')
             try:
-                output_data = self.convert_to_d5(str(file))
+                output_data = self.convert_to_d5(file)
                 lines = [data['lines'] for data in output_data]
                 div_data = [data['div_data'] for data in output_data]
             except ValueError as e:
@@ -94,28 +372,28 @@ class TEIParser:
                 return msg_include_formatter
 
     @staticmethod
-    def find_graphic_url(cust_events: ResultSet, corresp: str):
+    def find_graphic_url(cust_events: list[etree._Element], corresp: str):
         for event in cust_events:
             event_corresp = event.get('corresp')
             if event_corresp:
                 if corresp in event_corresp:
-                    graphic = event.find('graphic')
-                    if graphic:
+                    graphic = event.find('.//{*}graphic')
+                    if graphic is not None:
                         graphic_url = graphic.get('url')
                         return graphic_url
         return ''
 
     @staticmethod
-    def find_invno(idnos: ResultSet, corresp: str):
+    def find_invno(idnos: list[etree._Element], corresp: str):
         for idno in idnos:
-            xml_id = idno.get('xml:id')
+            xml_id = idno.get(_XML_ID)
             idno_corresp = idno.get('corresp')
             if xml_id:
                 if corresp.replace('#', '') in xml_id:
-                    return idno.text
+                    return _text(idno)
             elif idno_corresp:
                 if corresp in idno_corresp:
-                    return idno.text
+                    return _text(idno)
         return ''
 
     def convert_to_d5(self, file_path: str, test: bool = False) -> tuple[list[dict], list[str]] | list[dict]:
@@ -126,73 +404,71 @@ class TEIParser:
         :return: A list of lists. Each list of string represents a text part, i.e. every line as string contained in TEI
         <ab> tags; list of errors.
         """
+        # formatting errors are reported per file; otherwise they pile up when ignore_formatting_issues is set
+        self.formatter.error_log = []
         if not test:
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    file = f.read()
+                with open(file_path, 'rb') as f:
+                    root = etree.parse(f, _TEI_PARSER).getroot()
             except FileNotFoundError as e:
                 return [{}], [str(e)]
         else:
-            file = file_path
-        soup = BeautifulSoup(file, 'lxml-xml')
-        cust_events = soup.find_all('custEvent')
-        inv_nos = soup.find_all('idno', attrs={'type': 'invNo'})
-        self.formatter.get_languages(soup)
-        text_parts = soup.find_all('ab')
+            root = etree.fromstring(file_path.encode('utf-8'), _TEI_PARSER)
+        if root is None:
+            return []
+        cust_events = list(root.iter('{*}custEvent'))
+        inv_nos = [idno for idno in root.iter('{*}idno') if idno.get('type') == 'invNo']
+        self.formatter.get_languages(root)
+        text_parts = root.iter('{*}ab')
         output = []
         graphic_url = ''
         inv_no = ''
         for ab in text_parts:
-            div = ab.find_parent('div')
+            div = next(ab.iterancestors('{*}div'), None)
             div_name = div.get('n')
             div_subtype = div.get('subtype')
             corresp = div.get('corresp')
             if corresp:
                 graphic_url = self.find_graphic_url(cust_events, corresp)
                 inv_no = self.find_invno(inv_nos, corresp)
-            ab_soup = BeautifulSoup(str(ab), 'lxml-xml')
-            try:
-                line = ab_soup.find_all('lb')[0]
-            except IndexError:
+            line = ab.find('.//{*}lb')
+            if line is None:
                 continue
             # Uses the sibling by sibling approach to parse the contents of <ab>
-            sibling = line.next_sibling
-            text: str = ''
-            while sibling:
-                if sibling is None:
-                    break
-                elif str(sibling).strip() == '':
-                    sibling = sibling.next_sibling
+            parts: list[str] = []
+            for sibling in _following(line):
+                if isinstance(sibling, str) and (not sibling or sibling.isspace()):
                     continue
                 if debug_mode:
-                    self.logger.debug(f'XML sibling: {str(sibling).strip()}')
-                if isinstance(sibling, Tag):
+                    self.logger.debug(f'XML sibling: {_to_string(sibling).strip()}')
+                if isinstance(sibling, str):
+                    converted_text = convert_to_standardized_majuscule(sibling.strip())
+                    parts.append(converted_text)
+                    if debug_mode:
+                        self.logger.debug(f'Converted text: {repr(converted_text)}')
+                elif sibling.text is None and not len(sibling) and _name(sibling) == 'lb':
+                    # <lb/> is by far the most frequent tag; bypass parse_contents() and transform()
+                    parts.append('\n')
+                else:
                     parser_results = self.parse_contents(sibling)
-                    text += parser_results
+                    parts.append(parser_results)
                     if debug_mode:
                         self.logger.debug(f'Parsed: {repr(parser_results)}')
-                elif isinstance(sibling, NavigableString):
-                    converted_text = convert_to_standardized_majuscule(sibling.strip())
-                    text += converted_text
-                    if debug_mode:
-                        self.logger.debug(f'Converted NavigableString: {repr(converted_text)}')
-                sibling = sibling.next_sibling
-            # handle insertions caused by <add>, cf. add()
-            line_text: list[str] = list(filter(None, text.split('\n')))
-            line_text = self.insert_lines(line_text)
-            # Making sure lines are formatted correctly; Validating format
-            for i in range(len(line_text)):
-                line_text[i] = self.formatter.format_line(line_text[i])
-                if line_text[i] == '':
-                    continue
-                line_text[i] = self.formatter.validate_line(line_text[i])
+            line_text: list[str] = list(filter(None, ''.join(parts).split('\n')))
+            # handle insertions caused by <add>, cf. add(); Making sure lines are formatted correctly; Validating format
+            lines = []
+            for line_str in self.insert_lines(line_text):
+                line_str = self.formatter.format_line(line_str)
+                if line_str:
+                    line_str = self.formatter.validate_line(line_str)
+                    if line_str:
+                        lines.append(line_str)
             div_data = {'div_name': div_name, 'div_subtype': div_subtype, 'inv_no': inv_no,
                         'graphic_url': graphic_url}
-            lines = list(filter(None, line_text))
             output.append({'lines': lines, 'div_data': div_data})
         return output
 
-    def parse_contents(self, sibling: Tag | PageElement, parsed='', parent_name='') -> str:
+    def parse_contents(self, sibling: etree._Element, parsed='', parent_name='') -> str:
         """
         Parses contents of a tag; uses recursion if necessary.
         :param sibling: XML sibling
@@ -200,179 +476,213 @@ class TEIParser:
         :param parent_name: Parent name of the processed tag
         :return: Parsed contents as string
         """
-        sibling_name: str = sibling.name
+        sibling_name: str = _name(sibling)
         # in case of reg return empty string
         if sibling_name == 'reg' or parent_name == 'reg':
             return ''
         # return parser results if the following conditions are true
         if sibling_name == 'rdg' or (sibling_name == 'del' and parent_name == ''):
             return parsed.replace(' ', '')
-        contents = sibling.contents
+        contents = _contents(sibling)
+        first = next(contents, None)
         # expan, supplied, subst and add are handled by transform(), tags without children (= no contents) are equally
-        # handled; else: in case of children, transform() if a NavigableString is found, else call parse_contents
-        if not contents or sibling_name in ['expan', 'supplied', 'subst', 'add', 'gap', 'hi']:
-            parsed += self.transform(sibling_name, sibling.attrs, sibling.text.strip(), sibling, parent_name)
+        # handled; else: in case of children, transform() if a text node is found, else call parse_contents
+        if first is None or sibling_name in _TRANSFORM_WHOLE_TAGS:
+            parsed += self.transform(sibling_name, sibling.attrib, _text(sibling).strip(), sibling, parent_name)
             if sibling_name == 'space':
                 return parsed
             else:
                 return parsed.replace(' ', '')
         else:
-            for child in contents:
-                if isinstance(child, NavigableString):
-                    parsed += self.transform(sibling_name, sibling.attrs, child.text.strip(), sibling, parent_name)
+            # spaces are removed from each part once instead of from the whole result on every level of recursion;
+            # results of parse_contents() are already free of spaces except for <space>
+            parsed = parsed.replace(' ', '')
+            for child in chain((first,), contents):
+                if isinstance(child, str):
+                    parsed += self.transform(sibling_name, sibling.attrib, child.strip(), sibling,
+                                             parent_name).replace(' ', '')
+                elif _name(child) == 'space':
+                    parsed += self.parse_contents(child, parent_name=sibling_name).replace(' ', '')
                 else:
-                    parsed += self.parse_contents(child, parent_name=sibling.name)
-        return parsed.replace(' ', '')
+                    parsed += self.parse_contents(child, parent_name=sibling_name)
+        return parsed
 
-    def transform(self, tag: str, attrs: dict, text: str, node: PageElement | Tag, parent_name: str) -> None | str:
+    def transform(self, tag: str, attrs: dict, text: str, node: etree._Element, parent_name: str) -> None | str:
         """
-        Transforms XML elements according to the D4 standard.
+        Transforms XML elements according to the D4 standard by dispatching to the handler registered for the tag in
+        TEIParser._TRANSFORMS; tags without a handler are transformed to an empty string.
         :param tag: Name of the tag
-        :param attrs: List of attributes produced by PageElement.attrs
+        :param attrs: Attributes of the tag (etree._Element.attrib)
         :param text: Complete text which the tag contains
-        :param node: PageElement representation of the target XML node
+        :param node: lxml element of the target XML node
         :param parent_name: Name of the parent tag
         :return: Empty string or parsed text
         """
-        text = convert_to_standardized_majuscule(text)
-        if tag == 'lb':
-            return '\n'
-        elif tag == 'gap':
-            return self.gap(attrs)
-        elif tag == 'space':
-            return self.space(attrs)
-        elif tag == 'supplied':
-            supplied_text = ''
-            for child in node.children:
-                if isinstance(child, Tag):
-                    if child.name:
-                        supplied_text += self.parse_contents(child)
-                elif isinstance(child, NavigableString):
-                    supplied_text += convert_to_standardized_majuscule(child.text.strip())
-            return self.supplied(supplied_text, attrs)
-        elif tag == 'unclear':
-            return self.add_char_to_each_letter(text, '\u0323')
-        elif tag == 'milestone':
-            return self.milestone(attrs)
-        elif tag == 'expan':
-            parent_text = ''
-            ex_text = ''
-            for c in node.contents:
-                if isinstance(c, NavigableString):
-                    parent_text += convert_to_standardized_majuscule(c)
-                elif isinstance(c, Tag):
-                    if c.name == 'ex':
-                        ex_text += self.ex(convert_to_standardized_majuscule(c.text.strip()))
-                    else:
-                        parent_text += self.parse_contents(c)
-            if parent_text:
-                return parent_text
-            else:
-                return ex_text
-        elif tag == 'ex':
+        handler = self._TRANSFORMS.get(tag)
+        if handler is None:
             return ''
-        elif tag == 'add':
-            text = ''
-            for c in node.contents:
-                if isinstance(c, NavigableString):
-                    text += convert_to_standardized_majuscule(c.strip())
-                elif isinstance(c, Tag):
-                    text += self.parse_contents(c)
-            return self.add(text, attrs)
-        elif tag == 'num':
-            if 'tick' in attrs:
-                return f"{text}'"
+        return handler(self, attrs, convert_to_standardized_majuscule(text), node, parent_name)
+
+    def _transform_text(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        return text
+
+    def _transform_empty(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        return ''
+
+    def _transform_lb(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        return '\n'
+
+    def _transform_gap(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        return self.gap(attrs)
+
+    def _transform_space(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        return self.space(attrs)
+
+    def _transform_supplied(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        supplied_text = ''
+        for child in _contents(node):
+            if isinstance(child, str):
+                supplied_text += convert_to_standardized_majuscule(child.strip())
             else:
-                return text
-        elif tag == 'lem':
-            return text
-        elif tag == 'orig':
-            return text
-        elif tag == 'sic':
-            return text
-        elif tag == 'subst':
-            subst_text = ''
-            for child in node.children:
-                if isinstance(child, Tag):
-                    if child.name == 'add':
-                        if isinstance(child, Tag):
-                            if child.attrs['place'] == 'inline':
-                                for content in child.contents:
-                                    if isinstance(content, NavigableString):
-                                        subst_text += convert_to_standardized_majuscule(content)
-                                    elif isinstance(content, Tag):
-                                        subst_text += self.parse_contents(content)
-                                break
-                    if child.name == 'del':
-                        for c in child.contents:
-                            if isinstance(c, NavigableString):
-                                subst_text += convert_to_standardized_majuscule(c.strip())
-                            elif isinstance(c, Tag):
-                                subst_text += self.parse_contents(c, parent_name='subst')
-            return subst_text
-        elif tag == 'del':
-            if parent_name == 'subst':
-                return text
+                supplied_text += self.parse_contents(child)
+        return self.supplied(supplied_text, attrs)
+
+    def _transform_unclear(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        return self.add_char_to_each_letter(text, '\u0323')
+
+    def _transform_milestone(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        return self.milestone(attrs)
+
+    def _transform_expan(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        parent_text = ''
+        ex_text = ''
+        for c in _contents(node):
+            if isinstance(c, str):
+                parent_text += convert_to_standardized_majuscule(c)
+            elif _name(c) == 'ex':
+                ex_text += self.ex(convert_to_standardized_majuscule(_text(c).strip()))
             else:
-                return ''
-        elif tag == 'g':
-            return self.gtype(attrs)
-        elif tag == 'surplus':
-            return text
-        elif tag == 'abbr':
+                parent_text += self.parse_contents(c)
+        if parent_text:
+            return parent_text
+        else:
+            return ex_text
+
+    def _transform_add(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        text = ''
+        for c in _contents(node):
+            if isinstance(c, str):
+                text += convert_to_standardized_majuscule(c.strip())
+            else:
+                text += self.parse_contents(c)
+        return self.add(text, attrs)
+
+    def _transform_num(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        if 'tick' in attrs:
+            return f"{text}'"
+        else:
             return text
-        elif tag == 'hi':
-            children = node.children
-            child_hi = ''
-            for child in children:
-                if isinstance(child, Tag):
-                    if child.name == 'hi':
-                        child_hi = self.hi(child.attrs, '')
-                        current_hi = self.hi(attrs, '')
-                        for content in child.contents:
-                            if isinstance(content, NavigableString):
-                                return (convert_to_standardized_majuscule(child.text)) + current_hi + child_hi
-                            elif isinstance(content, Tag):
-                                return self.transform(content.name, content.attrs, content.text, content,
-                                                      content.parent.name) + current_hi + child_hi
-                    elif child.name == 'gap':
-                        text = self.gap(child.attrs)
-                        return self.hi(attrs, text)
-            if not child_hi:
-                return self.hi(attrs, text)
-        elif tag == 'q':
+
+    def _transform_subst(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        subst_text = ''
+        for child in node:
+            if not isinstance(child.tag, str):
+                continue
+            child_name = _name(child)
+            if child_name == 'add':
+                if child.attrib['place'] == 'inline':
+                    for content in _contents(child):
+                        if isinstance(content, str):
+                            subst_text += convert_to_standardized_majuscule(content)
+                        else:
+                            subst_text += self.parse_contents(content)
+                    break
+            if child_name == 'del':
+                for c in _contents(child):
+                    if isinstance(c, str):
+                        subst_text += convert_to_standardized_majuscule(c.strip())
+                    else:
+                        subst_text += self.parse_contents(c, parent_name='subst')
+        return subst_text
+
+    def _transform_del(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        if parent_name == 'subst':
             return text
         else:
             return ''
 
+    def _transform_g(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> str:
+        return self.gtype(attrs)
+
+    def _transform_hi(self, attrs: dict, text: str, node: etree._Element, parent_name: str) -> None | str:
+        child_hi = ''
+        for child in node:
+            if not isinstance(child.tag, str):
+                continue
+            child_name = _name(child)
+            if child_name == 'hi':
+                child_hi = self.hi(child.attrib, '')
+                current_hi = self.hi(attrs, '')
+                for content in _contents(child):
+                    if isinstance(content, str):
+                        return (convert_to_standardized_majuscule(_text(child))) + current_hi + child_hi
+                    else:
+                        return self.transform(_name(content), content.attrib, _text(content), content,
+                                              _name(content.getparent())) + current_hi + child_hi
+            elif child_name == 'gap':
+                text = self.gap(child.attrib)
+                return self.hi(attrs, text)
+        if not child_hi:
+            return self.hi(attrs, text)
+
+    # Handlers of transform() by tag name
+    _TRANSFORMS = {
+        'lb': _transform_lb,
+        'gap': _transform_gap,
+        'space': _transform_space,
+        'supplied': _transform_supplied,
+        'unclear': _transform_unclear,
+        'milestone': _transform_milestone,
+        'expan': _transform_expan,
+        'ex': _transform_empty,
+        'add': _transform_add,
+        'num': _transform_num,
+        'lem': _transform_text,
+        'orig': _transform_text,
+        'sic': _transform_text,
+        'subst': _transform_subst,
+        'del': _transform_del,
+        'g': _transform_g,
+        'surplus': _transform_text,
+        'abbr': _transform_text,
+        'hi': _transform_hi,
+        'q': _transform_text,
+    }
+
     def insert_lines(self, line_text: list[str]):
         """
         Inserts lines as prepared by add().
         :param line_text: A list containing every line of text
         :return: The processed list
         """
-        insertions = []
-        for i in range(len(line_text)):
-            left_find = re.findall(r'<(.*?)<', line_text[i])
+        lines = []
+        # insertions after the previous line precede the insertions before the current one
+        right_of_previous = []
+        for line in line_text:
+            left_find = _RE_LEFT_INSERTION.findall(line)
             left_find.reverse()
-            right_find = re.findall(r'>(.*?)>', line_text[i])
+            right_find = _RE_RIGHT_INSERTION.findall(line)
             for string in left_find:
-                line_text[i] = line_text[i].replace('<' + string + '<', '')
-                insertions.append((i, string))
+                line = line.replace('<' + string + '<', '')
             for string in right_find:
-                line_text[i] = line_text[i].replace('>' + string + '>', '')
-                insertions.append((i + 1, string))
-        insertion_count = 0
-        for tpl in insertions:
-            index = tpl[0] + insertion_count
-            text = tpl[1]
-            try:
-                line_text.insert(index, text)
-            except IndexError:
-                line_text.append(text)
-            line_text[index] = self.formatter.format_line(line_text[index])
-            insertion_count += 1
-        return line_text
+                line = line.replace('>' + string + '>', '')
+            for string in right_of_previous + left_find:
+                lines.append(self.formatter.format_line(string))
+            lines.append(line)
+            right_of_previous = right_find
+        for string in right_of_previous:
+            lines.append(self.formatter.format_line(string))
+        return lines
 
     @staticmethod
     def add_char_to_each_letter(input_string, char_to_add):
@@ -382,10 +692,9 @@ class TEIParser:
         :param char_to_add: Char which is added to every char in input_string
         :return: Processed string
         """
-        result = ""
-        for letter in input_string:
-            result += letter + char_to_add
-        return result
+        if not input_string:
+            return ''
+        return char_to_add.join(input_string) + char_to_add
 
     @staticmethod
     def gap(attr: dict):
@@ -400,23 +709,22 @@ class TEIParser:
             elif attr['reason'] == 'illegible':
                 if 'quantity' in attr:
                     quantity = int(attr['quantity'])
-                    return ''.join(["-" for _ in range(quantity)])
+                    return '-' * quantity
                 else:
                     try:
-                        return ''.join(["-" for _ in range(round((int(attr['atLeast']) + int(attr['atMost'])) / 2))])
+                        return '-' * _midpoint(attr)
                     except KeyError:
                         return '[?]'
             elif 'quantity' in attr:
                 quantity = int(attr['quantity'])
-                return '[' + ''.join(["-" for _ in range(quantity)]) + ']'
+                return '[' + '-' * quantity + ']'
             elif 'extent' in attr:
                 if attr['extent'] == 'unknown':
                     return '[?]'
                 else:
                     return ''
             elif 'atLeast' in attr:
-                return ('[' + ''.join(["-" for _ in range(round((int(attr['atLeast']) + int(attr['atMost'])) / 2))])
-                        + ']')
+                return '[' + '-' * _midpoint(attr) + ']'
             else:
                 return '[?]'
         except KeyError:
@@ -434,9 +742,9 @@ class TEIParser:
                 return ''
             elif 'quantity' in attr:
                 quantity = int(attr['quantity'])
-                return ''.join([" " for _ in range(quantity)])
+                return ' ' * quantity
             elif 'atLeast' in attr:
-                return ''.join([" " for _ in range(round((int(attr['atLeast']) + int(attr['atMost'])) / 2))])
+                return ' ' * _midpoint(attr)
             elif 'extent' in attr:
                 return ' ? '
             else:
@@ -452,22 +760,13 @@ class TEIParser:
         :param attrs: Attributes of <supplied>
         :return: String representation of <supplied>
         """
-        text = text.replace(' ', '')
-        if 'reason' in attrs:
-            if attrs['reason'] == 'omitted':
-                return ''
-            else:
-                filler = ''.join(["-" for _ in range(len(text))])
-                if len(filler) >= 1:
-                    return f'[{filler}]'
-                else:
-                    return ''
+        if attrs.get('reason') == 'omitted':
+            return ''
+        length = len(text) - text.count(' ')
+        if length:
+            return f"[{'-' * length}]"
         else:
-            filler = ''.join(["-" for _ in range(len(text))])
-            if len(filler) >= 1:
-                return f'[{filler}]'
-            else:
-                return ''
+            return ''
 
     def milestone(self, attrs: dict):
         """
@@ -476,20 +775,13 @@ class TEIParser:
         :return: String representation of <milestone>
         """
         if 'rend' in attrs:
-            unicode_map = {
-                "paragraphos": '\n\u2e0f',
-                "horizontal-rule": '\n\u2015',
-                "diple-obelismene": '\n\u2E10',
-                "wavy-line": '\n\u223C',
-                "coronis": '\n\u2E0E'
-            }
             try:
-                return unicode_map[attrs['rend']]
+                return _MILESTONE_MAP[attrs['rend']]
             except KeyError:
                 if debug_mode:
-                    self.io_handler.create_folder('dev')
-                    self.io_handler.write_text_to_file('not_yet_implemented.txt', f'milestone rend="{attrs['rend']}"\n',
-                                                       mode='a')
+                    self.io_handler.create_folder(os.path.dirname(not_yet_implemented_path))
+                    self.io_handler.write_text_to_file(not_yet_implemented_path,
+                                                       f'milestone rend="{attrs['rend']}"\n', mode='a')
                 return ''
         else:
             return ''
@@ -501,94 +793,7 @@ class TEIParser:
         :param text: Text of <ex>
         :return: Unicode representation of parsed <ex>
         """
-        text = text[0:5]
-        unicode_map = {
-            # year
-            "ΕΤΟΥΣ": "\U00010179",
-            "ΕΤΟΣ": "\U00010179",
-            "ΕΤΩΝ": "\U00010179",
-            "ΕΤΕΣΙ": "\U00010179",
-            # measures
-            "ΑΡΟΥΡ": "\U00010187",
-            "ΑΡΤΑΒ": "\U00010186",
-            "ΧΟΙΝΙ": "\uE674",
-            "ΞΕΣΤΗ": "\U00010185",
-            "ΞΕΣΤΟ": "\U00010185",
-            "ΞΕΣΤΩ": "\U00010185",
-            "ΛΙΤΡΑ": "\U00010183",
-            "ΛΙΤΡΩ": "\U00010183",
-            "ΟΥΓΚΙ": "\U00010184",
-            "ΜΕΤΡΕ": "\uE63D",
-            "ΜΕΤΡΟ": "\uE63D",
-            # numbers and fractions
-            "ΤΡΙΤΟ": "\u2C85",
-            "ΤΕΤΑΡ": "\uE606",
-            # money
-            "ΔΡΑΧΜ": "\U0001017B",
-            "ΟΒΟΛΟ": "\U0001017C",
-            "ΔΙΩΒΟ": "\U0001017D",
-            "ΤΡΙΩΒ": "\U0001017E",
-            "ΤΕΤΡΩ": "\U0001017F",
-            "ΠΕΝΤΩ": "\U00010180",
-            "ΗΜΙΩΒ": "\uE675",
-            "ΗΜΙΟΒ": "\uE675",
-            "ΧΑΛΚΟ": "\u2CAC",
-            "ΔΙΧΑΛ": "\u2CAD",
-            "ΚΕΡΑΤ": "\uE67D",
-            "ΤΑΛΑΝ": "\U0001017A",
-            "ΔΗΝΑΡ": "\uE6A3",
-            "ΝΟΜΙΣ": "\uE696",
-            "ΜΥΡΙΑ": "\uE616",
-            # wheat
-            "ΠΥΡΟΥ": "\uE63E",
-            "ΠΥΡΩ": "\uE63E",
-            "ΠΥΡΩΙ": "\uE63E",
-            "ΠΥΡΟΝ": "\uE63E",
-            "ΠΥΡΟΣ": "\uE63E",
-            # operators
-            "ΓΙΝΟΝ": "\uE691",
-            "ΓΙΝΕΤ": "\uE691",
-            "ΓΙΓΝΟ": "\uE691",
-            "ΓΙΓΝΕ": "\uE691",
-            "ΛΟΙΠΩ": "\uE613",
-            "ΛΟΙΠΟ": "\uE613",
-            # fractions
-            "ΗΜΙΣΥ": "\U00010175",
-            # monograms
-            "ΠΡΟΣ": "\U0000E688",
-            "ΓΡΑΜΜ": "\U0000E689",
-            "ΖΜΥΡΝ": "\U0000E68A",
-            "ΩΡΑ": "\U0000E68B",
-            "ΩΡΑΣ": "\U0000E68B",
-            "ΜΕΡΙΣ": "\U0000E68C",
-            "ΜΕΡΙΔ": "\U0000E68C",
-            "ΧΕΙΡΙ": "\U0000E68E",
-            "ΧΡΩ": "\U00002CE9",
-            # other symbols
-            "ΑΥΤΟΣ": "\U0000E632",
-            "ΑΥΤΟΥ": "\U0000E632",
-            "ΑΥΤΩ": "\U0000E632",
-            "ΑΥΤΩΙ": "\U0000E632",
-            "ΑΥΤΟΝ": "\U0000E632",
-            "ΑΥΤΟΙ": "\U0000E632",
-            "ΑΥΤΩΝ": "\U0000E632",
-            "ΑΥΤΗ": "\U0000E632",
-            "ΑΥΤΗΣ": "\U0000E632",
-            "ΑΥΤΗΙ": "\U0000E632",
-            "ΑΥΤΗΝ": "\U0000E632",
-            "ΑΥΤΑΙ": "\U0000E632",
-            "ΑΥΤΑΣ": "\U0000E632",
-            "ΧΑΙΡΕ": "\U0000E687",
-            "ΥΠΕΡ": "\U0000E67A",
-            "ΟΜΟΥ": "\U0000E670",
-            "ΙΝΔΙΚ": "\U0000E698",
-            # additional symbols
-            "ΔΙΜΟΙ": "\U0000E698",
-        }
-        if text in unicode_map:
-            return unicode_map[text]
-        else:
-            return '\u2105'
+        return _EX_MAP.get(text[0:5], '\u2105')
 
     @staticmethod
     def add(text: str, attrs: dict):
@@ -634,89 +839,7 @@ class TEIParser:
         :return: String representation of parsed <g>
         """
         if 'type' in attrs:
-            unicode_map = {
-                "anti-sigma": "\u037B",
-                "antisigma": "\u037B",
-                "antisigma-periestigmene": "\u037D",
-                "apostrophe": "\u0027",
-                "asteriskos": "\u002A",
-                "backslash": "\uFE68",
-                "backtick": "\u2E0C",
-                "brevis": "\u02D8",
-                "center-brace-closing": "\u23AC",
-                "check": "\u2044",
-                "chi-periestigmenon": "\u00B7\u03A7\u00B7",
-                "chirho": "\u2627",
-                "coronis": "\u2E0E",
-                "coronis-lower-half": "\U000F0224",
-                "cross": "\u271D",
-                "dagger": "\u2020",
-                "dash": "\u2012",
-                "dicolon": "\u003A",
-                "di-punctus": "\u205A",
-                "diastole": "\u02BC",
-                "diple": "\uFE65",
-                "diple-obelismene": "\u291A",
-                "diple-periestigmene": "\u2E16",
-                "dipunct": "\u205A",
-                "dot": "\u2E31",
-                "dotted-obelos": "\u2E13",
-                "double-horizontal-bar": "\u0305" + "\u0332",
-                "double-slanting-stroke": "\u002F" + "\u002F",
-                "double-vertical-bar": "\u2016",
-                "downwards-ancora": "\u2E15",
-                "filled-circle": "\u29BF",
-                "filler": "\u07DF",
-                "hedera": "\u2766",
-                "high-puctus": "\u0387",
-                "high-punctus": "\u0387",
-                "high-puncuts": "\u0387",
-                "hight-punctus": "\u0387",
-                "hyphen": "\u2010",
-                "hypodiastole": "\u2E12",
-                "long-vertical-bar": "\u007C",
-                "low-punctus": "\uFE52",
-                "lower-brace-closing": "\u23AD",
-                "lower-brace-opening": "\u23A9",
-                "middot": "\u00B7",
-                "middod": "\u00B7",
-                "obelos": "\u2015",
-                "obelos-periestigmenos": "\u2E13",
-                "parens-deletion-closing": "\u23AC",
-                "parens-deletion-opening": "\u23A8",
-                "parens-lower-closing": "\u23A0",
-                "parens-lower-opening": "\u239D",
-                "parens-middle-closing": "\u239F",
-                "parens-middle-opening": "\u239C",
-                "parens-upper-closing": "\u239E",
-                "parens-upper-opening": "\u239B",
-                "parens-punctuation-closing": "\u23AC",
-                "parens-punctuation-opening": "\u23A8",
-                "parent-punctuation-opening": "\u23A8",
-                "percent": "\u0025",
-                "reverse-dotted-obelos": "\u00B7\u005C\u00B7",
-                "rho-cross": "\u2CE8",
-                "s-etous": "\U00010179",
-                "short-vertical-bar": "\uE197",
-                "sinusoid-stroke": "\uE0E7",
-                "slanting-stroke": "\u002F",
-                "slashed-N": "\u203E",
-                "stauros": "\u2020",
-                "swungdash": "\u007E",
-                "tetrapunct": "\u2058",
-                "tilde": "\u007E",
-                "tripunct": "\u22EE",
-                "upper-brace-closing": "\u23AB",
-                "upper-brace-opening": "\u23A7",
-                "upward-pointing-arrowhead": "\u2197",
-                "upwards-ancora": "\u2E15",
-                "x": "\u004E",
-                "xs": "\u004E\u004E\u004E"
-            }
-            try:
-                return unicode_map[attrs['type']]
-            except KeyError:
-                return ''
+            return _GTYPE_MAP.get(attrs['type'], '')
         else:
             return ''
 
@@ -728,25 +851,9 @@ class TEIParser:
         :return: String representation of parsed <hi>
         """
         rend = attrs['rend']
-        if rend == "diaeresis":
-            return f'{text}\u0308'
-        elif rend == "asper":
-            return f'{text}\u0314'
-        elif rend == "acute":
-            return f'{text}\u0301'
-        elif rend == "circumflex":
-            return f'{text}\u0342'
-        elif rend == "grave":
-            return f'{text}\u0300'
-        elif rend == "lenis":
-            return f'{text}\u0313'
-        elif rend == "overdot":
-            return f'{text}\u0307'
-        elif rend == "underlined" or rend == "underline":
-            return self.add_char_to_each_letter(text, '\u0332')
-        elif rend == "supraline":
-            return self.add_char_to_each_letter(text, '\u0305')
-        elif rend == "supraline-underline":
-            return self.add_char_to_each_letter(text, '\u0305\u0332')
+        if rend in _HI_COMBINING_MAP:
+            return text + _HI_COMBINING_MAP[rend]
+        elif rend in _HI_EACH_LETTER_MAP:
+            return self.add_char_to_each_letter(text, _HI_EACH_LETTER_MAP[rend])
         else:
             return text
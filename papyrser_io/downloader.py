@@ -1,7 +1,6 @@
-import glob
-import json
 import logging
 import os
+import tempfile
 import zipfile
 
 import requests
@@ -9,7 +8,10 @@ from tqdm import tqdm
 
 from config import papyri_data_path, debug_mode, tm_index_path, idp_data_path
 from papyrser_io.handler import IOHandler
-from papyrser_utils.utils import get_tm_from_paths
+from papyrser_utils.utils import get_tm_from_paths, iter_xml_files, load_paths_by_tm
+
+# Size up to which the downloaded archive is kept in memory before it is spooled to disk
+_ZIP_SPOOL_SIZE = 256 * 1024 * 1024
 
 
 class PapyriDownloader:
@@ -30,27 +32,30 @@ class PapyriDownloader:
         if debug_mode:
             self.logger.info('Downloading compressed papyri.info data')
         request = session.get(self.github_url, stream=True)
-        temp_zip_path = os.path.join(papyri_data_path, 'temp.zip')
-        with (open(temp_zip_path, 'wb') as f,
-              tqdm(unit='B', unit_scale=True, unit_divisor=1024, desc='Downloading') as bar):
-            for chunk in request.iter_content(chunk_size=1024):
-                f.write(chunk)
-                bar.update(len(chunk))
         if request.status_code == 200:
-            session.close()
-            if debug_mode:
-                self.logger.info('Extracting files')
-            with zipfile.ZipFile(temp_zip_path, 'r') as z:
-                names = z.namelist()
-                for i in tqdm(range(len(z.namelist())), total=len(z.namelist()), desc='Extracting'):
-                    if "DCLP" in names[i] or "DDB_EpiDoc_XML" in names[i]:
-                        z.extract(names[i], papyri_data_path)
-            os.remove(temp_zip_path)
+            # The archive is kept in memory up to _ZIP_SPOOL_SIZE and only rolls over to an anonymous temporary file
+            # beyond that; it is deleted automatically once extracted
+            with tempfile.SpooledTemporaryFile(max_size=_ZIP_SPOOL_SIZE, dir=papyri_data_path) as f:
+                with tqdm(unit='B', unit_scale=True, unit_divisor=1024, desc='Downloading') as bar:
+                    for chunk in request.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+                        bar.update(len(chunk))
+                session.close()
+                if debug_mode:
+                    self.logger.info('Extracting files')
+                f.seek(0)
+                with zipfile.ZipFile(f, 'r') as z:
+                    members = z.infolist()
+                    # Only the top-level DCLP and DDB_EpiDoc_XML directories of the archive (idp.data-master/...)
+                    root = members[0].filename.split('/', 1)[0] if members else ''
+                    prefixes = (f'{root}/DCLP/', f'{root}/DDB_EpiDoc_XML/')
+                    members = [m for m in members if m.filename.startswith(prefixes)]
+                    for member in tqdm(members, desc='Extracting'):
+                        z.extract(member, papyri_data_path)
             if os.path.exists(tm_index_path):
                 os.remove(tm_index_path)
         else:
             session.close()
-            os.remove(temp_zip_path)
             msg = f'Download failed. Status code: {request.status_code}'
             print(msg)
             if debug_mode:
@@ -64,16 +69,15 @@ class PapyriDownloader:
         """
         if debug_mode:
             self.logger.info('Caching TM numbers')
-        sep = os.path.sep
         dclp_path = os.path.normpath(os.path.join(idp_data_path, 'DCLP'))
         ddb_path = os.path.normpath(os.path.join(idp_data_path, 'DDB_EpiDoc_XML'))
         xml_files = []
         if os.path.exists(dclp_path):
-            xml_files = glob.glob(dclp_path + f'{sep}**{sep}*.xml', recursive=True)
+            xml_files = list(iter_xml_files(dclp_path))
         else:
             self.logger.error(f'Could not find {dclp_path}')
         if os.path.exists(ddb_path):
-            xml_files += glob.glob(ddb_path + f'{sep}**{sep}*.xml', recursive=True)
+            xml_files += iter_xml_files(ddb_path)
         else:
             self.logger.error(f'Could not find {ddb_path}')
         if not xml_files:
@@ -82,5 +86,7 @@ class PapyriDownloader:
             self.logger.critical(msg)
             print(msg)
             exit(1)
-        data = get_tm_from_paths(xml_files, desc='Indexing')
-        self.io_handler.write_text_to_file(tm_index_path, json.dumps(data))
+        paths_by_tm = get_tm_from_paths(xml_files, desc='Indexing')
+        # json objects only have string keys
+        self.io_handler.write_json_to_file(tm_index_path, {str(tm): paths for tm, paths in paths_by_tm.items()})
+        load_paths_by_tm.cache_clear()
@@ -4,6 +4,11 @@ import os
 
 from config import debug_mode, main_path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class IOHandler:
     def __init__(self):
@@ -13,6 +18,8 @@ class IOHandler:
         """
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
         self.export_directory = ''
+        # Directories already created by this handler, so repeated writes to the same directory skip os.makedirs
+        self._created_dirs: set[str] = set()
 
     def set_export_directory(self, export_directory: str):
         """
@@ -28,8 +35,11 @@ class IOHandler:
         Creates a directory matching the specified path if it does not exist yet.
         :param path: Path to the new directory
         """
+        if path in self._created_dirs:
+            return
         try:
             os.makedirs(path, exist_ok=True)
+            self._created_dirs.add(path)
         except (OSError, IOError) as e:
             print(f'[!] Unable to create folder: {e}')
             if debug_mode:
@@ -54,6 +64,44 @@ class IOHandler:
             print(msg)
             exit(1)
 
+    def write_bytes_to_file(self, filename: str, data: bytes):
+        """
+        Writes already encoded data to a file in binary mode, bypassing the text layer's encoding and newline handling.
+        :param filename: Name of the file to write to
+        :param data: Encoded data to write to the file
+        """
+        try:
+            with open(filename, 'wb') as file:
+                file.write(data)
+        except IOError as e:
+            msg = f'An error occurred while writing to the file: {e}'
+            if debug_mode:
+                self.logger.critical(msg)
+            print(msg)
+            exit(1)
+
+    def write_json_to_file(self, filename: str, obj, indent: int | None = None):
+        """
+        Serializes an object to a json file. Compact output is encoded with orjson if it is installed, otherwise (and
+        for indented output, since orjson only supports an indentation of 2) json.dump streams the encoded chunks to
+        the file instead of building the complete json string in memory first.
+        :param filename: Name of the file to write to
+        :param obj: json serializable object
+        :param indent: Indentation passed to json.dump, default None (compact)
+        """
+        if orjson is not None and indent is None:
+            self.write_bytes_to_file(filename, orjson.dumps(obj))
+            return
+        try:
+            with open(filename, 'w', encoding='utf-8') as file:
+                json.dump(obj, file, ensure_ascii=False, indent=indent)
+        except IOError as e:
+            msg = f'An error occurred while writing to the file: {e}'
+            if debug_mode:
+                self.logger.critical(msg)
+            print(msg)
+            exit(1)
+
     def write_to_json(self, tm: int, original_filename: str, content: list[list[str]], div_data: list[dict]) -> str:
         """
         Writes parsed data to a json file with metadata in head, text parts in body. See documentation for detailed info
@@ -70,12 +118,11 @@ class IOHandler:
         self.create_folder(target_path)
         path = os.path.join(target_path, f'{tm}_{original_filename}.json')
         text_blocks = []
-        for i in range(len(content)):
-            data = div_data[i]
-            data['text'] = content[i]
+        for data, lines in zip(div_data, content):
+            data['text'] = lines
             text_blocks.append(data)
         content = {'text_blocks': text_blocks}
-        self.write_text_to_file(path, json.dumps(content, ensure_ascii=False, indent=4))
+        self.write_json_to_file(path, content, indent=4)
         return path
 
     def write_to_txt(self, tm: int, original_filename: str, content: list[list[str]]) -> str:
@@ -92,15 +139,8 @@ class IOHandler:
         target_path = os.path.join(target_path, 'txt')
         self.create_folder(target_path)
         path = os.path.join(target_path, f'{tm}_{original_filename}.txt')
-        if os.path.exists(path):
-            os.remove(path)
-        for i in range(len(content)):
-            text_part = content[i]
-            for line_index in range(len(text_part)):
-                text = text_part[line_index]
-                # print without \n if last line of text part and last text part of content is reached
-                if line_index == len(text_part) - 1 and i == len(content) - 1:
-                    self.write_text_to_file(path, text, mode='a')
-                else:
-                    self.write_text_to_file(path, text + '\n', mode='a')
+        # Join all text parts once and write them encoded with a single call (no line separator after the last line).
+        # os.linesep keeps the line endings text mode would have produced
+        text = os.linesep.join(line for text_part in content for line in text_part)
+        self.write_bytes_to_file(path, text.encode('utf-8'))
         return path
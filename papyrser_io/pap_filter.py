@@ -1,14 +1,34 @@
-import glob
 import os
 from dataclasses import dataclass
 from multiprocessing import Pool
-from typing import Literal, Callable
+from typing import Literal
 
 from lxml import etree
 from tqdm import tqdm
 from colorama import Fore, Style
 
 ns = {'tei': 'http://www.tei-c.org/ns/1.0'}
+_TITLE = f'{{{ns["tei"]}}}title'
+_TITLE_STMT = f'{{{ns["tei"]}}}titleStmt'
+_IDNO = f'{{{ns["tei"]}}}idno'
+_PUBLICATION_STMT = f'{{{ns["tei"]}}}publicationStmt'
+_ORIG_PLACE = f'{{{ns["tei"]}}}origPlace'
+_ORIGIN = f'{{{ns["tei"]}}}origin'
+_TEI_HEADER = f'{{{ns["tei"]}}}teiHeader'
+
+
+def _first_text(element: etree.ElementBase) -> str | None:
+    """
+    Gets the first text node of an element, i.e. the equivalent of the XPath expression text()[1].
+    :param element: lxml element
+    :return: First text node or None
+    """
+    if element.text is not None:
+        return element.text
+    for child in element:
+        if child.tail is not None:
+            return child.tail
+    return None
 
 
 @dataclass
@@ -44,57 +64,88 @@ class PapyrusFilter:
             print(Fore.RED + '[PapyrusFilter] ERROR: title, place, or dclp_hybrid must be set.' + Style.RESET_ALL)
             exit(1)
 
-    def filter_file(self, file: str, get_tm_from_path: Callable[[str], list[dict]]) -> list[int]:
+    def filter_file(self, file: str) -> list[int]:
+        # Imported here, since papyrser_utils.utils imports config, which in turn imports this module
+        from papyrser_utils.utils import get_tm_from_path
         tms: list[int] = []
-        root = etree.parse(file)
+        match_dclp_hybrid = self.target == 'dclp' and self.dclp_hybrid
+        if not self.single_match_suffices and not (self.title and match_dclp_hybrid and self.place):
+            # All three criteria have to match, which is impossible if one of them is not set
+            return tms
+        tags = [_TEI_HEADER]
+        if self.title:
+            tags.append(_TITLE)
+        if match_dclp_hybrid:
+            tags.append(_IDNO)
+        if self.place:
+            tags.append(_ORIG_PLACE)
         title_matches = False
         dclp_hybrid_matches = False
         place_matches = False
-        if self.title:
-            tei_title = root.xpath('//tei:titleStmt/tei:title/text()', namespaces=ns)
-            if tei_title:
-                if self.title.lower() in tei_title[0].lower():
-                    title_matches = True
-        if self.target == 'dclp':
-            if self.dclp_hybrid:
-                tei_dclp_hybrid = root.xpath('//tei:publicationStmt/tei:idno[@type="dclp-hybrid"]/text()',
-                                             namespaces=ns)
-                if tei_dclp_hybrid:
-                    if self.dclp_hybrid.lower() in tei_dclp_hybrid[0].lower():
-                        dclp_hybrid_matches = True
-        if self.place:
-            tei_place = root.xpath('//tei:origin/tei:origPlace/text()', namespaces=ns)
-            if tei_place:
-                if self.place.lower() in tei_place[0].lower():
-                    place_matches = True
+        tei_title = None
+        tei_dclp_hybrid = None
+        tei_place = None
+        # All filter criteria are part of <teiHeader>: stream the file and stop parsing at its end, at the first match if
+        # a single match suffices or at the first mismatch otherwise, instead of building the tree of the complete
+        # document
+        with open(file, 'rb') as f:
+            for _, element in etree.iterparse(f, events=('end',), tag=tags, collect_ids=False):
+                tag = element.tag
+                if tag == _TEI_HEADER:
+                    break
+                parent = element.getparent()
+                parent_tag = parent.tag if parent is not None else None
+                mismatch = False
+                if tei_title is None and tag == _TITLE and parent_tag == _TITLE_STMT:
+                    tei_title = _first_text(element)
+                    if tei_title is not None:
+                        title_matches = self.title.lower() in tei_title.lower()
+                        mismatch = not title_matches
+                elif (tei_dclp_hybrid is None and tag == _IDNO and parent_tag == _PUBLICATION_STMT
+                      and element.get('type') == 'dclp-hybrid'):
+                    tei_dclp_hybrid = _first_text(element)
+                    if tei_dclp_hybrid is not None:
+                        dclp_hybrid_matches = self.dclp_hybrid.lower() in tei_dclp_hybrid.lower()
+                        mismatch = not dclp_hybrid_matches
+                elif tei_place is None and tag == _ORIG_PLACE and parent_tag == _ORIGIN:
+                    tei_place = _first_text(element)
+                    if tei_place is not None:
+                        place_matches = self.place.lower() in tei_place.lower()
+                        mismatch = not place_matches
+                element.clear()
+                if self.single_match_suffices:
+                    if title_matches or dclp_hybrid_matches or place_matches:
+                        break
+                elif mismatch:
+                    return tms
         if self.single_match_suffices:
             if title_matches or dclp_hybrid_matches or place_matches:
                 xpath_tms = get_tm_from_path(file)
-                for tm in xpath_tms:
-                    tms.append(tm['tm'])
+                for tm, _ in xpath_tms:
+                    tms.append(tm)
         else:
             if title_matches and dclp_hybrid_matches and place_matches:
                 xpath_tms = get_tm_from_path(file)
-                for tm in xpath_tms:
-                    tms.append(tm['tm'])
+                for tm, _ in xpath_tms:
+                    tms.append(tm)
         return tms
 
-    def wrapper(self, args):
-        return self.filter_file(*args)
-
     def filter(self):
-        from papyrser_utils.utils import get_tm_from_path
+        from papyrser_utils.utils import iter_xml_files
         if self.target == 'dclp':
-            files = glob.glob(os.path.join(self.idp_data_path, 'DCLP/**/*.xml'), recursive=True)
+            files = list(iter_xml_files(os.path.join(self.idp_data_path, 'DCLP')))
         elif self.target == 'ddb':
-            files = glob.glob(os.path.join(self.idp_data_path, 'DDB_EpiDoc_XML/**/*.xml'), recursive=True)
+            files = list(iter_xml_files(os.path.join(self.idp_data_path, 'DDB_EpiDoc_XML')))
         else:
-            files = glob.glob(os.path.join(self.idp_data_path, '**/*.xml'), recursive=True)
+            files = list(iter_xml_files(self.idp_data_path))
         tms: list[int] = []
-        pool = Pool(os.cpu_count() + 1)
-        inputs = [(file, get_tm_from_path) for file in files]
-        for result in tqdm(pool.imap_unordered(self.wrapper, inputs), total=len(files), desc='Filtering'):
-            if result:
-                for element in result:
-                    tms.append(element)
+        processes = os.cpu_count() or 1
+        # Hand the files to the workers in chunks instead of one task per file to reduce IPC overhead
+        chunksize = max(1, len(files) // (4 * processes))
+        with Pool(processes) as pool:
+            for result in tqdm(pool.imap_unordered(self.filter_file, files, chunksize=chunksize), total=len(files),
+                               desc='Filtering'):
+                if result:
+                    for element in result:
+                        tms.append(element)
         return tms
@@ -1,24 +1,67 @@
+import hashlib
 import json
 import logging
 import os
+import pickle
 import re
+from functools import lru_cache
 from multiprocessing import Pool
+from typing import Iterator
 
 from lxml import etree
 from tqdm import tqdm
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from config import tm_index_path
 
 greek_input = "ΌΏΎΊΉᾲᾀᾁᾂᾃᾅᾇέάΐήώίόύϝϛϋϊᾄᾆᾳᾴᾷαβγδεζηθικλμνξοπρστυφχψωἀἄἂἆἁἅἃἇάὰᾶἐἔἒἑἕἓὲέἠἤἢἦἡἥἣἧὴήᾐᾑᾒᾓᾔᾕᾖᾗῂῃῄῆῇἰἴἲἶἱἵἳἷὶίῐῑῒΐῖῗὀὄὂὁὅὃὸόὐὑὒὓὔὕὖὗὺῦύῠῡῢΰῧὠὤὢὦὡὥὣὧώὼᾠᾡᾢᾣᾤᾥᾦᾧῲῳῴῶῷῤῥἈἌἊἎἉἍἋἏᾺΆᾼᾈᾉᾊᾋᾌᾍᾎᾏἘἜἚἙἝἛῈΈἨἬἪἮἩἭἫἯῊΉῌᾘᾙᾚᾛᾜᾝᾞᾟἸἼἺἾἹἽἻἿΊῚῘῙὈὌὊὉὍὋΌῸὙὝὛὟΎῪῨῩὨὬὪὮὩὭὫὯΏῺῼᾨᾩᾪᾫᾬᾭᾮᾯῬςϲϹ"
 greek_output = "ΟΩΥΙΗΑΑΑΑΑΑΑΕΑΙΗΩΙΟΥϜϚΥΙΑΑΑΑΑΑΒΓΔΕΖΗΘΙΚΛΜΝΞΟΠΡΣΤΥΦΧΨΩΑΑΑΑΑΑΑΑΑΑΑΕΕΕΕΕΕΕΕΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΙΙΙΙΙΙΙΙΙΙΙΙΙΙΙΙΟΟΟΟΟΟΟΟΥΥΥΥΥΥΥΥΥΥΥΥΥΥΥΥΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΡΡΑΑΑΑΑΑΑΑΑΑΑΑΑΑΑΑΑΑΑΕΕΕΕΕΕΕΕΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΗΙΙΙΙΙΙΙΙΙΙΙΙΟΟΟΟΟΟΟΟΥΥΥΥΥΥΥΥΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΩΡΣΣΣ"
 ns = {'tei': 'http://www.tei-c.org/ns/1.0'}
+# Unknown milestone renditions are logged here in debug_mode
+not_yet_implemented_path = os.path.join('dev', 'not_yet_implemented.txt')
+# Shared by all XML files parsed in a process; xml:id attributes are never looked up, so their hash table is not built
+xml_parser = etree.XMLParser(collect_ids=False)
+_TM_INDEX_CACHE_PATH = os.path.splitext(tm_index_path)[0] + '.pkl'
+_TM_PATH_CACHE_PATH = os.path.join(os.path.dirname(tm_index_path), 'tm_path_cache.json')
+_IDNO = f'{{{ns["tei"]}}}idno'
+_TEI_HEADER = f'{{{ns["tei"]}}}teiHeader'
+_RE_TEI_HEADER_END = re.compile(rb'</(?:[\w.-]+:)?teiHeader\s*>')
+# Maps Greek characters to standardized majuscules and removes punctuation, diacritics and whitespace in the same pass
+_MAJUSCULE_STRIP_CHARS = "ʼ†∙·•{}()',;:.-⏑̆͂᾽᾿῎῞῾`΄“”’̓ʽ‘⌊⌋\n "
+_MAJUSCULE_TABLE = str.maketrans(greek_input, greek_output)
+_MAJUSCULE_TABLE.update({ord(c): None for c in _MAJUSCULE_STRIP_CHARS})
+# greek_input contains no ASCII characters, so ASCII-only text only needs the ASCII strip characters removed
+_MAJUSCULE_ASCII_STRIP = ''.join(c for c in _MAJUSCULE_STRIP_CHARS if c.isascii()).encode('ascii')
 
 
 def before_running():
     """Execute before running the script routine."""
-    not_yet_impl_path = 'dev/not_yet_implemented.txt'
-    if os.path.exists(not_yet_impl_path):
-        os.remove(not_yet_impl_path)
+    try:
+        os.remove(not_yet_implemented_path)
+    except FileNotFoundError:
+        pass
+
+
+def iter_xml_files(path: str) -> Iterator[str]:
+    """
+    Recursively yields the paths of all XML files in a directory. Uses os.scandir, whose directory entries already
+    know their type, instead of glob.glob(..., recursive=True), which matches and stats every entry of the tree.
+    Hidden files and directories are skipped like glob does.
+    :param path: Path to the directory
+    :return: Generator of paths to XML files
+    """
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                yield from iter_xml_files(entry.path)
+            elif entry.name.endswith('.xml'):
+                yield entry.path
 
 
 def setup_logging(log_file='log.txt'):
@@ -35,15 +78,103 @@ def setup_logging(log_file='log.txt'):
     )
 
 
+@lru_cache(maxsize=8192)
 def convert_to_standardized_majuscule(input_str):
     """
-    Converts Greek text to standardized majuscule characters.
+    Converts Greek text to standardized majuscule characters. Results are cached, as the same short words and
+    numerals recur throughout a corpus.
     :param input_str: Greek text
     :return: Converted string
     """
-    translation_table = str.maketrans(greek_input, greek_output)
-    input_str = input_str.translate(translation_table)
-    return re.sub(r"[ʼ†∙·•{}()',;:.\-⏑̆͂᾽᾿῎῞῾`΄“”’̓ʽ‘⌊⌋\n ]", '', input_str)
+    if input_str.isascii():
+        return input_str.encode('ascii').translate(None, _MAJUSCULE_ASCII_STRIP).decode('ascii')
+    return input_str.translate(_MAJUSCULE_TABLE)
+
+
+def load_tm_index() -> dict[int, list[str]]:
+    """
+    Loads the index of TM numbers written by PapyriDownloader.index_tm_numbers().
+    :return: Dictionary mapping TM numbers to the paths of their XML files
+    """
+    with open(tm_index_path, 'rb') as f:
+        return _group_tm_index(_json_loads(f.read()))
+
+
+def _group_tm_index(index: dict[str, list[str]] | list[dict]) -> dict[int, list[str]]:
+    """
+    Converts a decoded TM index to a dictionary with int keys. Indexes written before the index became a dictionary
+    (a list of dictionaries with keys tm: int and path: str) are grouped by TM number.
+    :param index: Decoded json of the TM index
+    :return: Dictionary mapping TM numbers to the paths of their XML files
+    """
+    if isinstance(index, dict):
+        return {int(tm): paths for tm, paths in index.items()}
+    paths_by_tm: dict[int, list[str]] = {}
+    for d in index:
+        paths_by_tm.setdefault(d['tm'], []).append(d['path'])
+    return paths_by_tm
+
+
+def _json_loads(data: bytes):
+    """
+    Decodes json with orjson if it is installed, otherwise with json.
+    :param data: UTF-8 encoded json
+    :return: Decoded object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj) -> bytes:
+    """
+    Encodes json with orjson if it is installed, otherwise with json.
+    :param obj: json serializable object
+    :return: UTF-8 encoded json
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+@lru_cache(maxsize=1)
+def load_paths_by_tm() -> dict[int, tuple[str, ...]]:
+    """
+    Loads the TM index once per process and groups its unique paths by TM number. The result is pickled next to the
+    index together with the SHA-256 of the index file, so later runs skip decoding the json as long as the index is
+    unchanged. Call load_paths_by_tm.cache_clear() after rebuilding the index.
+    :return: Dictionary mapping TM numbers to the paths of their XML files
+    """
+    with open(tm_index_path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        with open(_TM_INDEX_CACHE_PATH, 'rb') as f:
+            cache = pickle.load(f)
+        if cache['sha256'] == digest:
+            return cache['paths_by_tm']
+    except (OSError, EOFError, KeyError, TypeError, ValueError, pickle.PickleError):
+        pass
+    result = {tm: tuple(dict.fromkeys(paths)) for tm, paths in _group_tm_index(_json_loads(data)).items()}
+    _write_cache(_TM_INDEX_CACHE_PATH,
+                 pickle.dumps({'sha256': digest, 'paths_by_tm': result}, protocol=pickle.HIGHEST_PROTOCOL))
+    return result
+
+
+def _write_cache(path: str, data: bytes):
+    """
+    Writes a cache file via a temporary file, since several worker processes may write the same cache at the same time.
+    Caches are optional, so failing to write one is ignored.
+    :param path: Path to the cache file
+    :param data: Content of the cache file
+    """
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
 
 
 def get_paths_to_tm(tm: int) -> list[str]:
@@ -52,58 +183,152 @@ def get_paths_to_tm(tm: int) -> list[str]:
     :param tm: TM number
     :return: The paths to XML files matching the TM number
     """
-    paths = []
-    with open(tm_index_path, 'r') as f:
-        data = json.loads(f.read())
-    for d in range(len(data)):
-        if data[d]['tm'] == tm:
-            paths.append(data[d]['path'])
-    return list(set(paths))
+    return list(load_paths_by_tm().get(tm, ()))
+
+
+def get_tms_from_collections(collections: list[str]) -> list[int]:
+    """
+    Gets the TM numbers of all DDB_EpiDoc_XML files belonging to the specified DDB collections by looking them up in the
+    TM index instead of parsing the collection's XML files again.
+    :param collections: DDB collection names, e.g. ['cpr', 'bgu']
+    :return: TM numbers found in the collections
+    """
+    wanted = {collection.lower() for collection in collections}
+    marker = f'{os.sep}DDB_EpiDoc_XML{os.sep}'
+    tms = []
+    for tm, paths in load_paths_by_tm().items():
+        for path in paths:
+            _, found, rest = path.partition(marker)
+            if found and rest.split(os.sep, 1)[0] in wanted:
+                tms.append(tm)
+    return tms
+
+
+def handle_multiple_tms(unique_list: list, xml_file_path: str) -> list[tuple[int, str]]:
+    return [(int(u), str(xml_file_path)) for u in unique_list if u]
+
+
+class _HeaderParsed(Exception):
+    """Raised by _TMNumberTarget at the end of <teiHeader> to stop parsing."""
+
+
+class _TMNumberTarget:
+    """
+    lxml parser target collecting the text nodes of tei:idno[@type="TM"] elements in <teiHeader>, i.e. the equivalent
+    of the XPath expression //tei:idno[@type="TM"]/text(), without building an element tree.
+    """
+
+    def __init__(self):
+        self.tms: list[str] = []
+        self._depth = 0
+        self._text: list[str] = []
+
+    def _flush(self):
+        if self._text:
+            self.tms.append(''.join(self._text))
+            self._text = []
 
+    def start(self, tag, attrib):
+        if self._depth:
+            self._flush()
+            self._depth += 1
+        elif tag == _IDNO and attrib.get('type') == 'TM':
+            self._depth = 1
 
-def handle_multiple_tms(unique_list: list, xml_file_path: str) -> list:
-    data = []
-    unique = [s for s in unique_list if s]
-    if len(unique) > 1:
-        for u in unique:
-            data.append({'tm': int(u), 'path': str(xml_file_path)})
-    elif len(unique) == 1:
-        data.append({'tm': int(unique[0]), 'path': str(xml_file_path)})
-    return data
+    def end(self, tag):
+        if self._depth:
+            self._flush()
+            self._depth -= 1
+        elif tag == _TEI_HEADER:
+            raise _HeaderParsed
 
+    def data(self, data):
+        # Only text directly inside the idno, not the text of its children
+        if self._depth == 1:
+            self._text.append(data)
 
-def get_tm_from_path(xml_file_path: str) -> list[dict]:
+    def comment(self, text):
+        if self._depth:
+            self._flush()
+
+    def pi(self, target, data):
+        if self._depth:
+            self._flush()
+
+    def close(self):
+        return self.tms
+
+
+def get_tm_from_path(xml_file_path: str) -> list[tuple[int, str]]:
     """
     Searches an XML file for tm numbers and returns an index of the TM number with its correlating path for quick
-    access.
+    access. Tuples instead of dictionaries keep the results small when they are sent back from pool workers.
     :param xml_file_path: Path to xml file
-    :return: List of Dictionaries with keys tm: int and path: str
+    :return: List of tuples (TM number, path)
     """
-    data = []
-    file_tree = etree.parse(xml_file_path)
-    tm = file_tree.xpath('//tei:idno[@type="TM"]/text()', namespaces=ns)
-    if len(tm) > 1:
-        for num in tm:
-            unique = list(set(num.split()))
-            data = handle_multiple_tms(unique, xml_file_path)
-    elif len(tm) == 1:
-        unique = list(set(tm[0].split()))
-        data = handle_multiple_tms(unique, xml_file_path)
-    return data
+    target = _TMNumberTarget()
+    parser = etree.XMLParser(target=target, resolve_entities=False)
+    # TM numbers are part of <teiHeader>: feed the file until the target reports its end, so neither a tree nor the
+    # text body is ever built
+    with open(xml_file_path, 'rb') as f:
+        chunk = f.read(16384)
+        # A header that ends within the first chunk without containing the bytes TM cannot hold a TM number, so such
+        # files are not parsed at all
+        header_end = _RE_TEI_HEADER_END.search(chunk)
+        if header_end and chunk.find(b'TM', 0, header_end.start()) == -1:
+            return []
+        try:
+            while chunk:
+                parser.feed(chunk)
+                chunk = f.read(16384)
+            parser.close()
+        except _HeaderParsed:
+            pass
+    # Every TM <idno> may hold several space-separated numbers; keep each number once, in document order
+    unique = list(dict.fromkeys(num for text in target.tms for num in text.split()))
+    return handle_multiple_tms(unique, xml_file_path)
 
 
-def get_tm_from_paths(xml_file_paths: list[str], desc='Preparing') -> list[dict]:
+def get_tm_from_paths(xml_file_paths: list[str], desc='Preparing') -> dict[int, list[str]]:
     """
     Searches multiple XML files for tm numbers and returns an index of TM numbers with their correlating paths for quick
     access.
     :param xml_file_paths: Paths to xml files
     :param desc: tqdm description
-    :return: List of dictionaries with keys tm: int and path: str
-    """
-    pool = Pool(os.cpu_count() + 1)
-    cache_data = []
-    for result in tqdm(pool.imap_unordered(get_tm_from_path, xml_file_paths), total=len(xml_file_paths), desc=desc):
-        if result:
-            for element in result:
-                cache_data.append(element)
-    return cache_data
+    :return: Dictionary mapping TM numbers to the paths of their XML files
+    """
+    # Results of files that are unchanged (same mtime and size) since the previous run are reused from the cache
+    try:
+        with open(_TM_PATH_CACHE_PATH, 'rb') as f:
+            path_cache = _json_loads(f.read())
+    except (OSError, ValueError):
+        path_cache = {}
+    new_path_cache = {}
+    paths_by_tm: dict[int, dict[str, None]] = {}
+    misses = []
+    for path in xml_file_paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            misses.append((path, None))
+            continue
+        file_stat = [stat.st_mtime_ns, stat.st_size]
+        cached = path_cache.get(path)
+        if cached and cached.get('stat') == file_stat and 'tms' in cached:
+            new_path_cache[path] = cached
+            for tm in cached['tms']:
+                paths_by_tm.setdefault(tm, {})[path] = None
+        else:
+            misses.append((path, file_stat))
+    processes = os.cpu_count() or 1
+    # Hand the paths to the workers in chunks instead of one task per file to reduce IPC overhead
+    chunksize = max(1, len(misses) // (4 * processes))
+    with Pool(processes) as pool:
+        results = pool.imap(get_tm_from_path, [path for path, _ in misses], chunksize=chunksize)
+        for (path, file_stat), result in tqdm(zip(misses, results), total=len(misses), desc=desc):
+            if file_stat is not None:
+                new_path_cache[path] = {'stat': file_stat, 'tms': [tm for tm, _ in result]}
+            for tm, tm_path in result:
+                paths_by_tm.setdefault(tm, {})[tm_path] = None
+    _write_cache(_TM_PATH_CACHE_PATH, _json_dumps(new_path_cache))
+    return {tm: list(paths) for tm, paths in paths_by_tm.items()}
@@ -1,6 +1,6 @@
 import unittest
 
-from bs4 import BeautifulSoup
+from lxml import etree
 
 from papyrser_core.format import Formatter
 from papyrser_core.parser import TEIParser
@@ -47,8 +47,8 @@ class TestFormatter(unittest.TestCase):
         xml = ('<body><head xml:lang="en"/><div xml:lang="grc" type="edition" xml:space="preserve">'
                '<lb n="1"/>ΑΒΓΔΕΦ<lb n="2"/><foreign xml:lang="la">comes</foreign>"'
                '</div></head></body>')
-        soup = BeautifulSoup(xml, 'lxml-xml')
-        formatter.get_languages(soup)
+        root = etree.fromstring(xml.encode('utf-8'), etree.XMLParser(recover=True))
+        formatter.get_languages(root)
         self.assertTrue('la' in formatter.langs)
         self.assertTrue('grc' in formatter.langs)
 
@@ -59,6 +59,13 @@ class TestFormatter(unittest.TestCase):
         self.assertEqual('ΑΒΕΗΙΚΜΟΡΤΧΥΖ', typos)
         formatter.validate_line('ΑΒΓΔΕΦ093[]')
         self.assertTrue(len(formatter.error_log) == 2)
+        # Correcting a typo must not discard errors of previous lines
+        self.assertEqual('ΑΒΓ', formatter.validate_line('ABΓ'))
+        self.assertTrue(len(formatter.error_log) == 2)
+        # <g type="reverse-dotted-obelos"/>
+        formatter.error_log = []
+        self.assertEqual('Α·\\·Β', formatter.validate_line('Α·\\·Β'))
+        self.assertEqual([], formatter.error_log)
 
 
 class TestTEIParser(unittest.TestCase):